@@ -1,10 +1,19 @@
 """MCP server for self-hosted Mem0 with Qdrant vector + Neo4j graph memory."""
 
 import os
+import sys
 
-from mem0_mcp.server import mcp
+import httpx
+
+from mem0_mcp.server import mcp, migrate_user_ids
 
 
 def main():
+    if sys.argv[1:] == ["migrate"]:
+        try:
+            print(migrate_user_ids())
+        except httpx.HTTPError as e:
+            sys.exit(f"Migration failed: {type(e).__name__}: {e}")
+        return
     transport = os.environ.get("MEM0_TRANSPORT", "stdio")
     mcp.run(transport=transport)
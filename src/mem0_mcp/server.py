@@ -8,14 +8,33 @@ Queries Neo4j for graph memory (entity relationships).
 
 import os
 import json
+import time
+import re
+import random
+import hashlib
+import sqlite3
+import functools
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, cast
+
 import httpx
-from neo4j import GraphDatabase
+import orjson
 from mcp.server.fastmcp import FastMCP
 
+if TYPE_CHECKING:
+    import numpy as np
+    from typing_extensions import LiteralString
+
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 
 API_BASE = os.environ.get("MEM0_API_BASE", "http://127.0.0.1:8765")
 QDRANT_URL = os.environ.get("MEM0_QDRANT_URL", "http://127.0.0.1:6333")
+QDRANT_GRPC = os.environ.get("MEM0_QDRANT_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.environ.get("MEM0_QDRANT_GRPC_PORT", "6334"))
 OLLAMA_URL = os.environ.get("MEM0_OLLAMA_URL", "http://127.0.0.1:11435")
 EMBED_MODEL = os.environ.get("MEM0_EMBED_MODEL", "nomic-embed-text:latest")
 EMBED_PROVIDER = os.environ.get("MEM0_EMBED_PROVIDER", "ollama")  # "ollama" or "openai"
@@ -23,10 +42,44 @@ EMBED_API_KEY = os.environ.get("MEM0_EMBED_API_KEY", "")
 EMBED_BASE_URL = os.environ.get("MEM0_EMBED_BASE_URL", "")
 COLLECTION = os.environ.get("MEM0_COLLECTION", "openmemory")
 USER_ID = os.environ.get("MEM0_USER_ID", "justin")
+# Payload keys that may hold the owner; any match counts. Legacy writers use
+# `userId`; after `mem0-mcp migrate` this can be narrowed to `user_id`.
+USER_ID_KEYS = [
+    k.strip() for k in os.environ.get("MEM0_USER_ID_KEYS", "user_id,userId").split(",")
+    if k.strip()
+]
 
 NEO4J_URL = os.environ.get("MEM0_NEO4J_URL", "bolt://127.0.0.1:7687")
 NEO4J_USER = os.environ.get("MEM0_NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.environ.get("MEM0_NEO4J_PASSWORD", "mem0graph")
+NEO4J_DATABASE = os.environ.get("MEM0_NEO4J_DATABASE", "neo4j")
+NEO4J_LABEL = os.environ.get("MEM0_NEO4J_LABEL", "")  # e.g. "__Entity__"; empty = any node
+NEO4J_REL_TYPES = os.environ.get("MEM0_NEO4J_REL_TYPES", "")  # comma-separated; empty = all
+
+EMBED_CACHE_SIZE = int(os.environ.get("MEM0_EMBED_CACHE_SIZE", "512"))
+EMBED_CACHE_TTL = float(os.environ.get("MEM0_EMBED_CACHE_TTL", "600"))
+NO_CACHE_PREFIX = "no-cache:"
+EMBED_CACHE_PATH = os.path.expanduser(
+    os.environ.get("MEM0_EMBED_CACHE_PATH", "~/.mem0_mcp/embed_cache.db")
+)
+EMBED_DISK_CACHE_TTL = float(os.environ.get("MEM0_EMBED_DISK_CACHE_TTL", "604800"))
+EMBED_DISK_CACHE_ROWS = 10_000
+EMBED_DISK_CACHE_BUSY_TIMEOUT = 0.1  # seconds; a lock held by another process is a miss
+ENTITY_CACHE_SIZE = int(os.environ.get("MEM0_ENTITY_CACHE_SIZE", "256"))
+ENTITY_CACHE_TTL = float(os.environ.get("MEM0_ENTITY_CACHE_TTL", "120"))
+SEARCH_PARAMS = {"hnsw_ef": int(os.environ.get("MEM0_HNSW_EF", "64")), "exact": False}
+USER_FILTER = {
+    "should" if len(USER_ID_KEYS) > 1 else "must": [
+        {"key": key, "match": {"value": USER_ID}} for key in USER_ID_KEYS
+    ]
+}
+LISTED_PAYLOAD_FIELDS = ["data", "memory", "text", "source_app", "runId"]
+NORMALIZE_INTERVAL = 300  # seconds between graph `name_lc`/`id_lc` backfills
+EMBED_ATTEMPTS = 3
+EMBED_BATCH_SIZE = int(os.environ.get(
+    "MEM0_EMBED_BATCH_SIZE",
+    "128" if os.environ.get("MEM0_EMBED_DEVICE") == "cuda" else "32",
+))
 
 # --- Server ---
 
@@ -39,50 +92,594 @@ mcp = FastMCP("mem0", instructions=(
 
 # --- Clients ---
 
-api_client = httpx.Client(base_url=API_BASE, timeout=120)
-qdrant_client = httpx.Client(base_url=QDRANT_URL, timeout=30)
-ollama_client = httpx.Client(base_url=OLLAMA_URL, timeout=60)
-embed_client = (
-    httpx.Client(
-        base_url=EMBED_BASE_URL,
-        headers={"Authorization": f"Bearer {EMBED_API_KEY}"},
-        timeout=30,
-    )
-    if EMBED_PROVIDER == "openai" and EMBED_BASE_URL
-    else None
+JSON_HEADERS = {"Content-Type": "application/json"}
+HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=20, max_connections=40, keepalive_expiry=30.0
 )
 
+
+def _http_client(base_url: str, read_timeout: float, **kwargs) -> httpx.Client:
+    """Build a pooled keep-alive client (HTTP/2 for https backends only).
+
+    Connect, write and pool waits are short so an unreachable backend fails
+    fast; only the read timeout varies with the backend's expected latency.
+    No custom transport, so HTTP(S)_PROXY / NO_PROXY still apply.
+    """
+    return httpx.Client(
+        base_url=base_url,
+        http2=True,
+        limits=HTTP_LIMITS,
+        timeout=httpx.Timeout(connect=2.0, read=read_timeout, write=5.0, pool=2.0),
+        **kwargs,
+    )
+
+
+@functools.cache
+def _get_client(name: str) -> httpx.Client:
+    """Lazy-init a shared HTTP client.
+
+    One of "api", "qdrant", "migrate" (Qdrant, long reads), "ollama" or "embed".
+    """
+    if name == "api":
+        # The API runs LLM fact extraction inside add_memory, hence the long read.
+        return _http_client(API_BASE, read_timeout=120)
+    if name == "qdrant":
+        return _http_client(QDRANT_URL, read_timeout=10)
+    if name == "migrate":
+        # Index builds and payload writes with wait=true can take minutes.
+        return _http_client(QDRANT_URL, read_timeout=600)
+    if name == "ollama":
+        return _http_client(OLLAMA_URL, read_timeout=30)
+    if name == "embed":
+        return _http_client(
+            EMBED_BASE_URL,
+            read_timeout=30,
+            headers={"Authorization": f"Bearer {EMBED_API_KEY}"},
+        )
+    raise ValueError(f"Unknown HTTP client: {name}")
+
+
 _neo4j_driver = None
+_qdrant_grpc = None
+_graph_prepared_at: float | None = None
+# Match on backfilled `name_lc`/`id_lc` only with a label to index them by;
+# cleared for the rest of the process if index setup or backfill fails.
+_graph_indexed = bool(NEO4J_LABEL)
+_NODE_LABEL = f":`{NEO4J_LABEL}`" if NEO4J_LABEL else ""
+_REL_TYPES = (
+    ":" + "|".join(f"`{t.strip()}`" for t in NEO4J_REL_TYPES.split(",") if t.strip())
+    if NEO4J_REL_TYPES.strip()
+    else ""
+)
+
+
+# --- Cypher ---
+
+_TEXT_INDEX_CYPHERS = tuple(
+    f"CREATE TEXT INDEX entity_{prop} IF NOT EXISTS FOR (n{_NODE_LABEL}) ON (n.{prop})"
+    for prop in ("name_lc", "id_lc")
+)
+
+_BACKFILL_CYPHER = f"""
+MATCH (n{_NODE_LABEL})
+WHERE (n.name IS NOT NULL AND n.name_lc IS NULL)
+   OR (n.id IS NOT NULL AND n.id_lc IS NULL)
+SET n.name_lc = toLower(n.name), n.id_lc = toLower(n.id)
+"""
+
+
+def _lowered(prop: str, indexed: bool) -> str:
+    """Cypher for the lowercase form of `n.<prop>`."""
+    return f"n.{prop}_lc" if indexed else f"toLower(n.{prop})"
+
+
+# Query builders run at import time over config values, never tool input, so
+# their results are safe to pass where the neo4j driver expects LiteralString.
+def _search_cypher(indexed: bool) -> "LiteralString":
+    """search_graph query, ranking whole-phrase matches above single words.
+
+    Indexed, each term seeks on the backfilled `_lc` properties; otherwise a
+    single scan tests every term per node instead of one scan per term.
+    """
+    if indexed:
+        match = f"""
+UNWIND $terms AS term
+MATCH (n{_NODE_LABEL})
+WHERE n.name_lc CONTAINS term
+   OR n.id_lc CONTAINS term
+WITH n, count(*) AS hits
+WITH n, hits, coalesce(n.name_lc, "") AS name_lc, coalesce(n.id_lc, "") AS id_lc"""
+    else:
+        match = f"""
+MATCH (n{_NODE_LABEL})
+WITH n, toLower(coalesce(n.name, "")) AS name_lc, toLower(coalesce(n.id, "")) AS id_lc
+WHERE any(t IN $terms WHERE name_lc CONTAINS t OR id_lc CONTAINS t)
+WITH n, name_lc, id_lc,
+     size([t IN $terms WHERE name_lc CONTAINS t OR id_lc CONTAINS t]) AS hits"""
+    return cast("LiteralString", match + f"""
+WITH n, hits, name_lc CONTAINS $phrase OR id_lc CONTAINS $phrase AS phrase_hit
+ORDER BY phrase_hit DESC, hits DESC
+LIMIT 25
+OPTIONAL MATCH (n)-[r{_REL_TYPES}]->(m{_NODE_LABEL})
+RETURN n.name AS source, n.id AS source_id,
+       type(r) AS relation, r.relationship AS rel_detail,
+       m.name AS target, m.id AS target_id
+ORDER BY phrase_hit DESC, hits DESC
+LIMIT 25
+""")
+
+
+def _entity_cypher(indexed: bool) -> "LiteralString":
+    """get_entity query; `indexed` matches on backfilled `_lc` properties."""
+    return cast("LiteralString", f"""
+MATCH (n{_NODE_LABEL})
+WHERE {_lowered("name", indexed)} = $entity_name
+   OR {_lowered("id", indexed)} = $entity_name
+CALL {{
+    WITH n
+    MATCH (n)-[r]->(target)
+    RETURN collect(DISTINCT {{rel: type(r), detail: r.relationship, target: target.name}}) AS outgoing
+}}
+CALL {{
+    WITH n
+    MATCH (source)-[r]->(n)
+    RETURN collect(DISTINCT {{rel: type(r), detail: r.relationship, source: source.name}}) AS incoming
+}}
+RETURN n.name AS entity,
+       reduce(acc = [], rels IN collect(outgoing) | acc + [r IN rels WHERE NOT r IN acc]) AS outgoing,
+       reduce(acc = [], rels IN collect(incoming) | acc + [r IN rels WHERE NOT r IN acc]) AS incoming
+""")
+
+
+_SEARCH_CYPHER = _search_cypher(indexed=True)
+_SEARCH_SCAN_CYPHER = _search_cypher(indexed=False)
+_ENTITY_CYPHER = _entity_cypher(indexed=True)
+_ENTITY_SCAN_CYPHER = _entity_cypher(indexed=False)
+
+
+def _get_qdrant_grpc():
+    """Lazy-init the gRPC Qdrant client (requires the `grpc` extra)."""
+    global _qdrant_grpc
+    if _qdrant_grpc is None:
+        from qdrant_client import QdrantClient
+
+        _qdrant_grpc = QdrantClient(
+            url=QDRANT_URL, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=True
+        )
+    return _qdrant_grpc
 
 
 def _get_neo4j():
-    """Lazy-init Neo4j driver (only connects when graph tools are used)."""
+    """Lazy-init Neo4j driver (only imported and connected when graph tools are used)."""
     global _neo4j_driver
     if _neo4j_driver is None:
+        from neo4j import GraphDatabase
+
         _neo4j_driver = GraphDatabase.driver(
-            NEO4J_URL, auth=(NEO4J_USER, NEO4J_PASSWORD)
+            NEO4J_URL,
+            auth=(NEO4J_USER, NEO4J_PASSWORD),
+            max_connection_pool_size=50,
+            connection_acquisition_timeout=30,
         )
+    _prepare_graph(_neo4j_driver)
     return _neo4j_driver
 
 
+def _prepare_graph(driver) -> None:
+    """Index entity names and backfill lowercase `name_lc`/`id_lc` properties.
+
+    Graph lookups are case-insensitive; matching on precomputed lowercase
+    properties lets `CONTAINS` use a text index instead of a label scan.
+    Only done when MEM0_NEO4J_LABEL is set; otherwise queries use toLower().
+    Entities written by other agents are found once the next backfill runs
+    (at most NORMALIZE_INTERVAL later). If the user lacks schema/write
+    privileges or the server has no text indexes, lookups fall back to
+    toLower() for the rest of the process.
+    """
+    global _graph_prepared_at, _graph_indexed
+    if not _graph_indexed:
+        return
+    now = time.monotonic()
+    if _graph_prepared_at is not None and now - _graph_prepared_at < NORMALIZE_INTERVAL:
+        return
+    from neo4j.exceptions import Neo4jError
+
+    try:
+        for cypher in _TEXT_INDEX_CYPHERS:
+            driver.execute_query(cypher, database_=NEO4J_DATABASE)
+        driver.execute_query(_BACKFILL_CYPHER, database_=NEO4J_DATABASE)
+    except Neo4jError as e:
+        logger.warning("Graph name indexing failed, matching with toLower(): %s", e)
+        _graph_indexed = False
+        return
+    _graph_prepared_at = now
+
+
+# --- Caches ---
+
+
+class _TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after insertion."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_embed_cache = _TTLCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL)
+_entity_cache = _TTLCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+_direct_write_ids = _TTLCache(maxsize=1024, ttl=3600)
+
+_embed_db: sqlite3.Connection | None = None
+_embed_db_opened = False
+_embed_db_lock = threading.Lock()
+
+
+def _get_embed_db() -> sqlite3.Connection | None:
+    """Lazy-open the on-disk embedding cache (None if disabled or unusable)."""
+    global _embed_db, _embed_db_opened
+    with _embed_db_lock:
+        if not _embed_db_opened:
+            _embed_db_opened = True
+            if EMBED_CACHE_PATH:
+                try:
+                    _embed_db = _open_embed_db(EMBED_CACHE_PATH)
+                except (OSError, sqlite3.Error):
+                    _embed_db = None
+    return _embed_db
+
+
+def _open_embed_db(path: str) -> sqlite3.Connection:
+    """Open the cache database, creating it and pruning stale rows.
+
+    Pruning is skipped if another process holds the write lock; it runs
+    again the next time a server starts.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(
+        path,
+        timeout=EMBED_DISK_CACHE_BUSY_TIMEOUT,
+        check_same_thread=False,
+        isolation_level=None,
+    )
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS embed_cache ("
+        "key TEXT PRIMARY KEY, vector BLOB NOT NULL, stored_at REAL NOT NULL)"
+    )
+    try:
+        db.execute(
+            "DELETE FROM embed_cache WHERE stored_at < ?",
+            (time.time() - EMBED_DISK_CACHE_TTL,),
+        )
+        db.execute(
+            "DELETE FROM embed_cache WHERE key NOT IN "
+            "(SELECT key FROM embed_cache ORDER BY stored_at DESC LIMIT ?)",
+            (EMBED_DISK_CACHE_ROWS,),
+        )
+    except sqlite3.OperationalError:
+        pass
+    return db
+
+
+def _disk_cache_get(key: str) -> "np.ndarray | None":
+    """Look up an unexpired embedding on disk (cache errors count as misses)."""
+    db = _get_embed_db()
+    if db is None:
+        return None
+    try:
+        with _embed_db_lock:
+            row = db.execute(
+                "SELECT vector FROM embed_cache WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - EMBED_DISK_CACHE_TTL),
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    if not row:
+        return None
+    import numpy as np
+
+    return np.frombuffer(row[0], dtype=np.float32)
+
+
+def _disk_cache_put(key: str, vector: "np.ndarray") -> None:
+    """Store an embedding on disk as raw float32 bytes (best effort)."""
+    db = _get_embed_db()
+    if db is None:
+        return
+    try:
+        with _embed_db_lock:
+            db.execute(
+                "INSERT OR REPLACE INTO embed_cache (key, vector, stored_at) VALUES (?, ?, ?)",
+                (key, vector.tobytes(), time.time()),
+            )
+    except sqlite3.Error:
+        pass
+
+
 # --- Helpers ---
 
 
-def _embed(text: str) -> list[float]:
-    """Get embedding vector from configured provider (Ollama or OpenAI-compatible)."""
-    if EMBED_PROVIDER == "openai" and embed_client:
-        resp = embed_client.post(
-            "/embeddings",
-            json={"model": EMBED_MODEL, "input": text},
+def _send_json(client: httpx.Client, method: str, url: str, body, **kwargs) -> httpx.Response:
+    """Send `body` encoded with orjson (numpy arrays serialize natively)."""
+    return client.request(
+        method,
+        url,
+        content=orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY),
+        headers=JSON_HEADERS,
+        **kwargs,
+    )
+
+
+def _read_json(resp: httpx.Response):
+    """Decode a JSON response body with orjson."""
+    return orjson.loads(resp.content)
+
+
+def _embed(text: str) -> "np.ndarray":
+    """Get embedding vector, served from the in-process or on-disk cache when possible.
+
+    Prefix the text with "no-cache:" to bypass the cache for a single call.
+    """
+    if text.startswith(NO_CACHE_PREFIX):
+        return _embed_uncached(text[len(NO_CACHE_PREFIX):])
+    key = hashlib.sha1(f"{EMBED_PROVIDER}\0{EMBED_MODEL}\0{text}".encode("utf-8")).hexdigest()
+    vector = _embed_cache.get(key)
+    if vector is None:
+        vector = _disk_cache_get(key)
+        if vector is None:
+            vector = _embed_uncached(text)
+            _disk_cache_put(key, vector)
+        _embed_cache.put(key, vector)
+    return vector
+
+
+def _embed_uncached(text: str) -> "np.ndarray":
+    """Get embedding vector from configured provider (Ollama or OpenAI-compatible).
+
+    Returned as a read-only, L2-normalized float32 array. Qdrant normalizes
+    for cosine distance anyway; doing it once here keeps the vector small.
+    """
+    import numpy as np
+
+    vector = np.asarray(_embed_batch([text])[0], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    vector.flags.writeable = False
+    return vector
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    """Embed many texts, sending up to EMBED_BATCH_SIZE inputs per request.
+
+    Halves the batch and retries when the provider rejects it as too large
+    (413) or fails with a server error. The reduced size holds for the rest
+    of this call only; the next call starts at EMBED_BATCH_SIZE again, so
+    set that to the provider's real limit rather than relying on halving.
+    """
+    vectors: list[list[float]] = []
+    batch_size = max(1, EMBED_BATCH_SIZE)
+    start = 0
+    while start < len(texts):
+        chunk = texts[start:start + batch_size]
+        try:
+            vectors.extend(_embed_request(chunk))
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if len(chunk) > 1 and (status == 413 or status >= 500):
+                batch_size = len(chunk) // 2
+                continue
+            raise
+        start += len(chunk)
+    return vectors
+
+
+_RETRYABLE_EMBED_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadError,
+    httpx.RemoteProtocolError,
+    httpx.HTTPStatusError,
+)
+
+
+def _embed_request(texts: list[str]) -> list[list[float]]:
+    """Embed a batch of texts, retrying transient provider failures.
+
+    Connection failures, dropped keep-alive connections (read errors,
+    protocol errors), 429 and 503 are retried with exponential backoff plus
+    jitter (~1s, ~2s, capped at 8s); embed POSTs are idempotent. Read
+    timeouts are not: a hung provider would otherwise hold the tool call
+    for several full timeouts. This is the only retry layer; the clients'
+    transports don't retry.
+    """
+    for attempt in range(EMBED_ATTEMPTS - 1):
+        try:
+            return _embed_once(texts)
+        except _RETRYABLE_EMBED_ERRORS as e:
+            transient = not isinstance(e, httpx.HTTPStatusError) or (
+                e.response.status_code in (429, 503)
+            )
+            if not transient:
+                raise
+            time.sleep(min(8.0, 2 ** attempt + random.uniform(0, 1)))
+    return _embed_once(texts)
+
+
+def _embed_once(texts: list[str]) -> list[list[float]]:
+    """Embed a batch of texts in a single provider request."""
+    if EMBED_PROVIDER == "openai" and EMBED_BASE_URL:
+        resp = _send_json(
+            _get_client("embed"), "POST", "/embeddings",
+            {"model": EMBED_MODEL, "input": texts},
         )
         resp.raise_for_status()
-        return resp.json()["data"][0]["embedding"]
-    resp = ollama_client.post(
-        "/api/embed",
-        json={"model": EMBED_MODEL, "input": text},
+        data = sorted(_read_json(resp)["data"], key=lambda d: d["index"])
+        return [d["embedding"] for d in data]
+    resp = _send_json(
+        _get_client("ollama"), "POST", "/api/embed",
+        {"model": EMBED_MODEL, "input": texts},
     )
     resp.raise_for_status()
-    return resp.json()["embeddings"][0]
+    return _read_json(resp)["embeddings"]
+
+
+def _search_terms(query: str) -> list[str]:
+    """Split a graph query into lowercase match terms.
+
+    The whole query is kept as the first term, plus every word of 3+
+    characters, so "Hetzner server" also matches entities named "hetzner"
+    or "server_1".
+    """
+    phrase = query.lower()
+    return list(dict.fromkeys([phrase, *re.findall(r"\w{3,}", phrase)]))
+
+
+def _mark_graph_stale() -> None:
+    """Drop cached entities and backfill entities written since on next lookup."""
+    global _graph_prepared_at
+    _graph_prepared_at = None
+    _entity_cache.clear()
+
+
+def migrate_user_ids() -> str:
+    """Index the owner keys and backfill `user_id` on legacy points.
+
+    Some writers (e.g. Atlas) store the owner under `userId` only. Once every
+    writer sets `user_id`, run this (`mem0-mcp migrate`) and set
+    MEM0_USER_ID_KEYS=user_id so reads use a single indexed filter.
+    """
+    for key in ("user_id", "userId"):
+        resp = _send_json(
+            _get_client("migrate"), "PUT", f"/collections/{COLLECTION}/index",
+            {"field_name": key, "field_schema": "keyword"},
+            params={"wait": "true"},
+        )
+        resp.raise_for_status()
+    return f"Backfilled user_id on {_normalize_payload()} point(s) in '{COLLECTION}'."
+
+
+def _normalize_payload() -> int:
+    """Set `user_id` on this user's points that only carry `userId`."""
+    updated = 0
+    offset = None
+    while True:
+        body = {
+            "limit": 256,
+            "with_payload": False,
+            "with_vector": False,
+            "filter": {
+                "must": [
+                    {"key": "userId", "match": {"value": USER_ID}},
+                    {"is_empty": {"key": "user_id"}},
+                ]
+            },
+        }
+        if offset is not None:
+            body["offset"] = offset
+        resp = _send_json(
+            _get_client("migrate"), "POST", f"/collections/{COLLECTION}/points/scroll", body
+        )
+        resp.raise_for_status()
+        result = _read_json(resp).get("result", {})
+        ids = [p["id"] for p in result.get("points", [])]
+        if ids:
+            resp = _send_json(
+                _get_client("migrate"), "POST", f"/collections/{COLLECTION}/points/payload",
+                {"payload": {"user_id": USER_ID}, "points": ids},
+                params={"wait": "true"},
+            )
+            resp.raise_for_status()
+            updated += len(ids)
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return updated
+
+
+def _search_points(vector: "np.ndarray", limit: int = 10) -> list[dict]:
+    """Vector-search this user's points, over gRPC when MEM0_QDRANT_GRPC is set.
+
+    Results are returned in the REST shape (`id`, `score`, `payload` keys)
+    regardless of transport.
+    """
+    if QDRANT_GRPC:
+        from qdrant_client import models
+
+        response = _get_qdrant_grpc().query_points(
+            collection_name=COLLECTION,
+            query=vector,
+            limit=limit,
+            with_payload=True,
+            search_params=models.SearchParams(**SEARCH_PARAMS),
+            query_filter=models.Filter.model_validate(USER_FILTER),
+        )
+        return [
+            {"id": p.id, "score": p.score, "payload": p.payload or {}}
+            for p in response.points
+        ]
+    resp = _send_json(
+        _get_client("qdrant"), "POST", f"/collections/{COLLECTION}/points/search",
+        {
+            "vector": vector,
+            "limit": limit,
+            "with_payload": True,
+            "filter": USER_FILTER,
+            "params": SEARCH_PARAMS,
+        },
+    )
+    resp.raise_for_status()
+    return _read_json(resp).get("result", [])
+
+
+def _note_direct_write(point: dict) -> None:
+    """Remember points written straight to Qdrant (e.g. by Atlas).
+
+    Those carry a `runId` but no OpenMemory `source_app`; delete_memory
+    sends them to Qdrant directly instead of paying for an API miss.
+    """
+    payload = point.get("payload") or {}
+    if "runId" in payload and "source_app" not in payload:
+        _direct_write_ids.put(str(point.get("id", "")), True)
+
+
+def _json_snippet(data, limit: int) -> str:
+    """Serialize `data` as JSON, stopping once `limit` characters are produced."""
+    parts = []
+    size = 0
+    for chunk in json.JSONEncoder().iterencode(data):
+        parts.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return "".join(parts)[:limit]
 
 
 def _extract_memory(payload: dict) -> str:
@@ -90,6 +687,23 @@ def _extract_memory(payload: dict) -> str:
     return payload.get("data", payload.get("memory", payload.get("text", "unknown")))
 
 
+_HIT_FORMAT = "- {} (relevance: {:.2f})".format
+
+
+def _format_hit(result: dict) -> str:
+    """Render one search result as a search_memories line."""
+    return _HIT_FORMAT(_extract_memory(result.get("payload", {})), result.get("score", 0))
+
+
+def _format_listed(point: dict) -> str:
+    """Render one scrolled point as a list_memories line."""
+    payload = point.get("payload", {})
+    content = _extract_memory(payload)
+    mid = str(point.get("id", ""))[:8]
+    source = payload.get("source_app", payload.get("runId", "unknown"))
+    return f"- [{mid}] ({source}) {content}"
+
+
 # --- Vector Memory Tools ---
 
 
@@ -105,30 +719,12 @@ def search_memories(query: str) -> str:
                "server architecture", "coding style")
     """
     vector = _embed(query)
-    resp = qdrant_client.post(
-        f"/collections/{COLLECTION}/points/search",
-        json={
-            "vector": vector,
-            "limit": 10,
-            "with_payload": True,
-            "filter": {
-                "should": [
-                    {"key": "user_id", "match": {"value": USER_ID}},
-                    {"key": "userId", "match": {"value": USER_ID}},
-                ]
-            },
-        },
-    )
-    resp.raise_for_status()
-    results = resp.json().get("result", [])
+    results = _search_points(vector)
     if not results:
         return "No matching memories found."
-    lines = []
     for r in results:
-        content = _extract_memory(r.get("payload", {}))
-        score = r.get("score", 0)
-        lines.append(f"- {content} (relevance: {score:.2f})")
-    return "\n".join(lines)
+        _note_direct_write(r)
+    return "\n".join(map(_format_hit, results))
 
 
 @mcp.tool()
@@ -143,14 +739,15 @@ def add_memory(text: str) -> str:
               TypeScript over Python for new projects")
     """
     try:
-        resp = api_client.post(
-            "/api/v1/memories/",
-            json={"text": text, "user_id": USER_ID},
+        resp = _send_json(
+            _get_client("api"), "POST", "/api/v1/memories/",
+            {"text": text, "user_id": USER_ID},
         )
         resp.raise_for_status()
     except Exception as e:
         return f"Error calling mem0 API: {type(e).__name__}: {e}"
-    data = resp.json()
+    _mark_graph_stale()
+    data = _read_json(resp)
     if data is None:
         return f"Memory submitted successfully (stored via {API_BASE})"
     results = data.get("results", data.get("items", []))
@@ -162,7 +759,7 @@ def add_memory(text: str) -> str:
         ]
         if stored:
             return f"Stored {len(stored)} memory/memories: " + "; ".join(stored)
-    return f"Memory processed. Response: {json.dumps(data)[:500]}"
+    return f"Memory processed. Response: {_json_snippet(data, 500)}"
 
 
 @mcp.tool()
@@ -171,32 +768,22 @@ def list_memories() -> str:
 
     Returns all memories from both Arc and Atlas in the shared store.
     """
-    resp = qdrant_client.post(
-        f"/collections/{COLLECTION}/points/scroll",
-        json={
+    resp = _send_json(
+        _get_client("qdrant"), "POST", f"/collections/{COLLECTION}/points/scroll",
+        {
             "limit": 100,
-            "with_payload": True,
+            "with_payload": {"include": LISTED_PAYLOAD_FIELDS},
             "with_vector": False,
-            "filter": {
-                "should": [
-                    {"key": "user_id", "match": {"value": USER_ID}},
-                    {"key": "userId", "match": {"value": USER_ID}},
-                ]
-            },
+            "filter": USER_FILTER,
         },
     )
     resp.raise_for_status()
-    points = resp.json().get("result", {}).get("points", [])
+    points = _read_json(resp).get("result", {}).get("points", [])
     if not points:
         return "No memories stored."
-    lines = []
     for p in points:
-        payload = p.get("payload", {})
-        content = _extract_memory(payload)
-        mid = str(p.get("id", ""))[:8]
-        source = payload.get("source_app", payload.get("runId", "unknown"))
-        lines.append(f"- [{mid}] ({source}) {content}")
-    return f"{len(points)} memories:\n" + "\n".join(lines)
+        _note_direct_write(p)
+    return f"{len(points)} memories:\n" + "\n".join(map(_format_listed, points))
 
 
 @mcp.tool()
@@ -206,17 +793,19 @@ def delete_memory(memory_id: str) -> str:
     Args:
         memory_id: The full UUID of the memory to delete
     """
-    # Try OpenMemory API first (cleans up SQLite + Qdrant)
-    try:
-        resp = api_client.delete(f"/api/v1/memories/{memory_id}/")
-        resp.raise_for_status()
-        return f"Deleted memory {memory_id}"
-    except httpx.HTTPStatusError:
-        pass
+    # Try OpenMemory API first (cleans up SQLite + Qdrant), unless the point
+    # is known to be written straight to Qdrant, where the API always misses
+    if _direct_write_ids.get(memory_id) is None:
+        try:
+            resp = _get_client("api").delete(f"/api/v1/memories/{memory_id}/")
+            resp.raise_for_status()
+            return f"Deleted memory {memory_id}"
+        except httpx.HTTPStatusError:
+            pass
     # Fallback: delete directly from Qdrant (for Atlas-created memories)
-    resp = qdrant_client.post(
-        f"/collections/{COLLECTION}/points/delete",
-        json={"points": [memory_id]},
+    resp = _send_json(
+        _get_client("qdrant"), "POST", f"/collections/{COLLECTION}/points/delete",
+        {"points": [memory_id]},
     )
     resp.raise_for_status()
     return f"Deleted memory {memory_id} (from Qdrant directly)"
@@ -235,24 +824,20 @@ def search_graph(query: str) -> str:
 
     Args:
         query: Entity or topic to search for (e.g., "Justin", "OpenClaw",
-               "Hetzner server")
+               "Hetzner server"). Multi-word queries match entities
+               containing any of the words.
     """
+    from neo4j import RoutingControl
+
     driver = _get_neo4j()
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (n)
-            WHERE toLower(n.name) CONTAINS toLower($search_term)
-               OR toLower(n.id) CONTAINS toLower($search_term)
-            OPTIONAL MATCH (n)-[r]->(m)
-            RETURN n.name AS source, n.id AS source_id,
-                   type(r) AS relation, r.relationship AS rel_detail,
-                   m.name AS target, m.id AS target_id
-            LIMIT 25
-            """,
-            search_term=query,
-        )
-        records = list(result)
+    terms = _search_terms(query)
+    records, _, _ = driver.execute_query(
+        _SEARCH_CYPHER if _graph_indexed else _SEARCH_SCAN_CYPHER,
+        terms=terms,
+        phrase=terms[0],
+        database_=NEO4J_DATABASE,
+        routing_=RoutingControl.READ,
+    )
 
     if not records:
         return f"No graph entities found matching '{query}'."
@@ -285,25 +870,30 @@ def get_entity(name: str) -> str:
     Args:
         name: The entity name (e.g., "Justin", "TypeScript", "Hetzner")
     """
+    key = name.strip().lower()
+    described = _entity_cache.get(key)
+    if described is None:
+        described = _describe_entity(key)
+        if described is None:
+            return f"Entity '{name}' not found in graph."
+        _entity_cache.put(key, described)
+    return described
+
+
+def _describe_entity(key: str) -> str | None:
+    """Format an entity's relationships, or None if no entity matches."""
+    from neo4j import RoutingControl
+
     driver = _get_neo4j()
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (n)
-            WHERE toLower(n.name) = toLower($entity_name)
-               OR toLower(n.id) = toLower($entity_name)
-            OPTIONAL MATCH (n)-[r_out]->(target)
-            OPTIONAL MATCH (source)-[r_in]->(n)
-            RETURN n.name AS entity,
-                   collect(DISTINCT {rel: type(r_out), detail: r_out.relationship, target: target.name}) AS outgoing,
-                   collect(DISTINCT {rel: type(r_in), detail: r_in.relationship, source: source.name}) AS incoming
-            """,
-            entity_name=name,
-        )
-        records = list(result)
+    records, _, _ = driver.execute_query(
+        _ENTITY_CYPHER if _graph_indexed else _ENTITY_SCAN_CYPHER,
+        entity_name=key,
+        database_=NEO4J_DATABASE,
+        routing_=RoutingControl.READ,
+    )
 
     if not records or not records[0]["entity"]:
-        return f"Entity '{name}' not found in graph."
+        return None
 
     rec = records[0]
     lines = [f"Entity: {rec['entity']}"]